@@ -1,8 +1,14 @@
 # backend/database.py
-from sqlalchemy import create_engine, Column, Integer, String, Text, Boolean, ForeignKey, Float, DateTime
+from sqlalchemy import (create_engine, Column, Integer, String, Text, Boolean, ForeignKey, Float, DateTime,
+                        LargeBinary, UniqueConstraint, inspect, text, func)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship, object_session
+from collections import OrderedDict
 import datetime
+import hashlib
+import threading
+import zlib
+from typing import Optional
 
 # Create SQLAlchemy engine and session
 DATABASE_URL = "sqlite:///functions.db"
@@ -10,16 +16,154 @@ engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Code bodies at least this large are stored zlib-compressed
+COMPRESSION_THRESHOLD_BYTES = 1024
+code_cache_size = 256
+
+class CodeBlob(Base):
+    __tablename__ = "code_blobs"
+
+    hash = Column(String, primary_key=True)  # sha256 of the source text
+    size = Column(Integer)  # Uncompressed size in bytes
+    compressed = Column(Boolean, default=False)
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class FunctionVersion(Base):
+    __tablename__ = "function_versions"
+    __table_args__ = (UniqueConstraint("function_id", "version"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    function_id = Column(Integer, ForeignKey("functions.id"), index=True)
+    version = Column(Integer)
+    code_hash = Column(String, ForeignKey("code_blobs.hash"), index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 class Function(Base):
     __tablename__ = "functions"  # Fix the double underscore format
-    
+
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     language = Column(String)
-    code = Column(Text)
     timeout = Column(Integer, default=30)
+    current_version_id = Column(Integer)  # Immutable FunctionVersion the function currently runs
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
+    current_version = relationship(
+        FunctionVersion,
+        primaryjoin="foreign(Function.current_version_id) == FunctionVersion.id",
+        uselist=False,
+        viewonly=True
+    )
+    versions = relationship(
+        FunctionVersion,
+        primaryjoin="Function.id == FunctionVersion.function_id",
+        order_by=FunctionVersion.version,
+        cascade="all, delete-orphan"
+    )
+
+    @property
+    def version(self) -> Optional[int]:
+        return self.current_version.version if self.current_version else None
+
+    @property
+    def code_hash(self) -> Optional[str]:
+        return self.current_version.code_hash if self.current_version else None
+
+    @property
+    def code(self) -> Optional[str]:
+        if not self.current_version:
+            return None
+        return load_code(object_session(self), self.current_version.code_hash)
+
+# Decoded source by content hash; entries can never go stale because blobs are immutable
+_code_cache: "OrderedDict[str, str]" = OrderedDict()
+_code_cache_lock = threading.Lock()
+
+def hash_code(code: str) -> str:
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+def store_code(db, code: str) -> str:
+    """Store a code body once per content hash and return the hash"""
+    code_hash = hash_code(code)
+    if db.get(CodeBlob, code_hash) is None:
+        raw = code.encode("utf-8")
+        data, compressed = raw, False
+        if len(raw) >= COMPRESSION_THRESHOLD_BYTES:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                data, compressed = packed, True
+        db.add(CodeBlob(hash=code_hash, size=len(raw), compressed=compressed, data=data))
+        db.flush()
+    return code_hash
+
+def load_code(db, code_hash: str) -> Optional[str]:
+    """Return the source for a content hash, decompressing and caching it"""
+    with _code_cache_lock:
+        if code_hash in _code_cache:
+            _code_cache.move_to_end(code_hash)
+            return _code_cache[code_hash]
+
+    blob = db.get(CodeBlob, code_hash)
+    if blob is None:
+        return None
+    code = (zlib.decompress(blob.data) if blob.compressed else blob.data).decode("utf-8")
+
+    with _code_cache_lock:
+        _code_cache[code_hash] = code
+        while len(_code_cache) > code_cache_size:
+            _code_cache.popitem(last=False)
+    return code
+
+def set_function_code(db, function: Function, code: str) -> FunctionVersion:
+    """Point a function at the version for this code, creating a new version if the code changed"""
+    code_hash = store_code(db, code)
+    if function.id is None:
+        db.add(function)
+        db.flush()
+
+    current = db.get(FunctionVersion, function.current_version_id) if function.current_version_id else None
+    if current is not None and current.code_hash == code_hash:
+        return current
+
+    latest = db.query(func.max(FunctionVersion.version)).filter(
+        FunctionVersion.function_id == function.id).scalar() or 0
+    version = FunctionVersion(function_id=function.id, version=latest + 1, code_hash=code_hash)
+    db.add(version)
+    db.flush()
+    function.current_version_id = version.id
+    return version
+
+def add_missing_columns(connection, table) -> None:
+    """Add columns introduced after a table was first created (SQLite can only ADD COLUMN)"""
+    existing = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+
+def migrate_inline_code() -> None:
+    """Move code stored inline on functions rows (pre-versioning schema) into versioned blobs"""
+    columns = {c["name"] for c in inspect(engine).get_columns("functions")}
+    if "code" not in columns:
+        return
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(text(
+            "SELECT id, code FROM functions WHERE current_version_id IS NULL AND code IS NOT NULL"
+        )).all()
+        for function_id, code in rows:
+            set_function_code(db, db.get(Function, function_id), code)
+        db.execute(text("UPDATE functions SET code = NULL WHERE current_version_id IS NOT NULL"))
+        db.commit()
+    finally:
+        db.close()
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            add_missing_columns(connection, table)
+    migrate_inline_code()
@@ -0,0 +1,190 @@
+# backend/export.py
+from sqlalchemy import select
+from datetime import datetime
+import argparse
+import csv
+import io
+import json
+import sys
+from typing import Dict, List, Any, Optional, Iterator
+
+from .metrics import MetricsSessionLocal, partitions_between, parse_duration
+
+EXPORT_COLUMNS = [
+    "function_name", "runtime", "language", "cold_start", "timestamp",
+    "initialization_time_ms", "execution_time_ms", "total_time_ms", "status", "error_message",
+    "code_version", "code_hash",
+]
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+DEFAULT_BATCH_SIZE = 5000
+
+class ChunkSink:
+    """Write-only file object that hands back what was written so far while keeping absolute offsets"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def require_pyarrow(export_format: str):
+    """Import pyarrow for the columnar formats, failing clearly when it isn't installed"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        raise RuntimeError(f"The {export_format} export format requires pyarrow to be installed")
+
+def iter_metric_batches(db, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        function_name: Optional[str] = None, runtime: Optional[str] = None,
+                        status: Optional[str] = None,
+                        batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    """Yield raw metric rows in fixed-size batches, one partition at a time, oldest first"""
+    for table in partitions_between(db, start, end):
+        query = select(*[table.c[c] for c in EXPORT_COLUMNS]).order_by(table.c.timestamp)
+        if start:
+            query = query.where(table.c.timestamp >= start)
+        if end:
+            query = query.where(table.c.timestamp < end)
+        if function_name:
+            query = query.where(table.c.function_name == function_name)
+        if runtime:
+            query = query.where(table.c.runtime == runtime)
+        if status:
+            query = query.where(table.c.status == status)
+
+        # Server-side cursor: rows are fetched from SQLite as the batches are consumed
+        result = db.execute(query, execution_options={"stream_results": True, "yield_per": batch_size})
+        for rows in result.mappings().partitions(batch_size):
+            yield [dict(row) for row in rows]
+
+def _serialize_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def stream_csv(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows({k: _serialize_value(v) for k, v in row.items()} for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue().encode("utf-8")
+
+def stream_ndjson(batches: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for batch in batches:
+        yield "".join(json.dumps(row, default=_serialize_value) + "\n" for row in batch).encode("utf-8")
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ("function_name", pa.string()),
+        ("runtime", pa.string()),
+        ("language", pa.string()),
+        ("cold_start", pa.bool_()),
+        ("timestamp", pa.timestamp("us")),
+        ("initialization_time_ms", pa.int64()),
+        ("execution_time_ms", pa.int64()),
+        ("total_time_ms", pa.int64()),
+        ("status", pa.string()),
+        ("error_message", pa.string()),
+        ("code_version", pa.int64()),
+        ("code_hash", pa.string()),
+    ])
+
+def _stream_columnar(batches: Iterator[List[Dict[str, Any]]], export_format: str) -> Iterator[bytes]:
+    pa = require_pyarrow(export_format)
+    schema = _arrow_schema(pa)
+    sink = ChunkSink()
+    output = pa.PythonFile(sink, mode="w")
+    if export_format == "parquet":
+        writer = pa.parquet.ParquetWriter(output, schema)
+    else:
+        writer = pa.ipc.new_stream(output, schema)
+
+    # Each batch becomes one record batch / row group, flushed to the client straight away
+    for batch in batches:
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+def stream_metrics_export(export_format: str, batch_size: int = DEFAULT_BATCH_SIZE, **filters) -> Iterator[bytes]:
+    """Stream an export using its own session, so it outlives the request that started it"""
+    db = MetricsSessionLocal()
+    try:
+        batches = iter_metric_batches(db, batch_size=batch_size, **filters)
+        if export_format == "csv":
+            yield from stream_csv(batches)
+        elif export_format == "ndjson":
+            yield from stream_ndjson(batches)
+        else:
+            yield from _stream_columnar(batches, export_format)
+    finally:
+        db.close()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export raw execution metrics")
+    parser.add_argument("--format", choices=sorted(EXPORT_MEDIA_TYPES), default="csv")
+    parser.add_argument("--function", dest="function_name")
+    parser.add_argument("--runtime", choices=["docker", "gvisor"])
+    parser.add_argument("--status", choices=["success", "error", "timeout"])
+    parser.add_argument("--since", help="Only export the last duration, e.g. 24h or 7d")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="ISO start time (UTC)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="ISO end time (UTC)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--output", "-o", help="Output file (defaults to stdout)")
+    args = parser.parse_args(argv)
+
+    start = args.start
+    if args.since:
+        start = datetime.utcnow() - parse_duration(args.since)
+    if args.format in ("arrow", "parquet"):
+        require_pyarrow(args.format)
+
+    chunks = stream_metrics_export(
+        args.format, batch_size=args.batch_size, start=start, end=args.end,
+        function_name=args.function_name, runtime=args.runtime, status=args.status)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    main()
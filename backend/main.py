@@ -1,14 +1,22 @@
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy import func as sql_func
 from sqlalchemy.orm import Session
 from typing import Optional, List, Dict, Any
+from datetime import datetime
+import hashlib
 import logging
 import statistics
 # Just testing CI/CD trigger 🚀
 
 
-from backend.database import Function, SessionLocal, create_tables
-from backend.metrics import ExecutionMetric, save_execution_metrics, get_metrics_for_function, get_aggregated_metrics, create_metrics_tables
+from backend.database import (Function, FunctionVersion, CodeBlob, SessionLocal, create_tables,
+                              set_function_code, load_code)
+from backend.export import EXPORT_MEDIA_TYPES, require_pyarrow, stream_metrics_export
+from backend.metrics import (MetricsSessionLocal, save_execution_metrics, get_metrics_for_function,
+                             get_aggregated_metrics, get_metric_series, create_metrics_tables,
+                             start_maintenance_thread, DURATION_PATTERN)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -20,6 +28,7 @@ app = FastAPI(title="Serverless Function Platform")
 # Initialize database tables
 create_tables()
 create_metrics_tables()
+start_maintenance_thread()
 
 class FunctionCreate(BaseModel):
     name: str
@@ -27,6 +36,44 @@ class FunctionCreate(BaseModel):
     code: str
     timeout: int
 
+class FunctionSummary(BaseModel):
+    id: Optional[int] = None
+    name: str
+    language: Optional[str] = None
+    code: Optional[str] = None
+    version: Optional[int] = None
+    code_hash: Optional[str] = None
+    timeout: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class FunctionDetail(BaseModel):
+    id: int
+    name: str
+    language: str
+    code: str
+    version: Optional[int] = None
+    code_hash: Optional[str] = None
+    timeout: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        orm_mode = True
+
+# Fields returned by GET /functions/ when no projection is requested; code is opt-in
+DEFAULT_LIST_FIELDS = ["id", "name", "language", "timeout", "created_at", "updated_at"]
+VERSION_FIELDS = ["code", "version", "code_hash"]  # Resolved through the current version
+LIST_FIELDS = DEFAULT_LIST_FIELDS + VERSION_FIELDS
+
+class FunctionVersionInfo(BaseModel):
+    version: int
+    code_hash: str
+    size: int
+    compressed: bool
+    current: bool
+    created_at: Optional[datetime] = None
+
 class FunctionExecuteParams(BaseModel):
     runtime: Optional[str] = "docker"  # docker or gvisor
     warm_start: Optional[bool] = True  # Use container pool if true
@@ -39,11 +86,25 @@ def get_db():
     finally:
         db.close()
 
+def get_metrics_db():
+    db = MetricsSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def tag_code_version(result: Dict[str, Any], func: Function) -> None:
+    """Record which immutable code version produced an execution result"""
+    if "metrics" in result:
+        result["metrics"]["code_version"] = func.version
+        result["metrics"]["code_hash"] = func.code_hash
+
 @app.post("/functions/")
 async def create_function(func: FunctionCreate, db: Session = Depends(get_db)):
-    db_func = Function(**func.dict())
+    db_func = Function(**func.dict(exclude={"code"}))
     try:
         db.add(db_func)
+        set_function_code(db, db_func, func.code)
         db.commit()
         db.refresh(db_func)
         return {"message": "Function saved"}
@@ -51,27 +112,112 @@ async def create_function(func: FunctionCreate, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.get("/functions/")
-async def list_functions(db: Session = Depends(get_db)):
-    functions = db.query(Function).all()
-    return functions
+def parse_list_fields(fields: Optional[str]) -> List[str]:
+    """Resolve the ?fields= projection for the function listing"""
+    if not fields:
+        return DEFAULT_LIST_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in LIST_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    # Always include the name so rows can be identified
+    return ["name"] + [f for f in requested if f != "name"]
+
+@app.get("/functions/", response_model=List[FunctionSummary], response_model_exclude_unset=True)
+async def list_functions(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    columns = parse_list_fields(fields)
 
-@app.get("/functions/{name}")
+    # Cheap fingerprint of the table: any create, update or delete changes it
+    total, last_updated, last_id = db.query(
+        sql_func.count(Function.id), sql_func.max(Function.updated_at), sql_func.max(Function.id)
+    ).one()
+    fingerprint = f"{total}:{last_updated}:{last_id}:{limit}:{offset}:{','.join(columns)}"
+    etag = f'"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "X-Total-Count": str(total)}
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    query = db.query(*[getattr(Function, c) for c in columns if c not in VERSION_FIELDS])
+    wants_version = any(c in VERSION_FIELDS for c in columns)
+    if wants_version:
+        query = query.add_columns(FunctionVersion.version, FunctionVersion.code_hash) \
+            .outerjoin(FunctionVersion, FunctionVersion.id == Function.current_version_id)
+    rows = query.order_by(Function.id).offset(offset).limit(limit).all()
+
+    summaries = []
+    for row in rows:
+        values = row._asdict()
+        if wants_version:
+            if "code" in columns:
+                values["code"] = load_code(db, values["code_hash"]) if values["code_hash"] else None
+            for field in ("version", "code_hash"):
+                if field not in columns:
+                    values.pop(field)
+        summaries.append(FunctionSummary(**values))
+
+    response.headers.update(headers)
+    return summaries
+
+@app.get("/functions/{name}", response_model=FunctionDetail)
 async def get_function(name: str, db: Session = Depends(get_db)):
     func = db.query(Function).filter(Function.name == name).first()
     if not func:
         raise HTTPException(status_code=404, detail="Function not found")
-    return func
+    return FunctionDetail.from_orm(func)
 
 @app.put("/functions/{name}")
 async def update_function(name: str, updated: FunctionCreate, db: Session = Depends(get_db)):
     func = db.query(Function).filter(Function.name == name).first()
     if not func:
         raise HTTPException(status_code=404, detail="Function not found")
-    for field, value in updated.dict().items():
+    for field, value in updated.dict(exclude={"code"}).items():
         setattr(func, field, value)
+    version = set_function_code(db, func, updated.code)
     db.commit()
-    return {"message": "Function updated"}
+    return {"message": "Function updated", "version": version.version}
+
+@app.get("/functions/{name}/versions", response_model=List[FunctionVersionInfo])
+async def list_function_versions(name: str, db: Session = Depends(get_db)):
+    func = db.query(Function).filter(Function.name == name).first()
+    if not func:
+        raise HTTPException(status_code=404, detail="Function not found")
+    rows = db.query(FunctionVersion, CodeBlob.size, CodeBlob.compressed) \
+        .join(CodeBlob, CodeBlob.hash == FunctionVersion.code_hash) \
+        .filter(FunctionVersion.function_id == func.id) \
+        .order_by(FunctionVersion.version.desc()).all()
+    return [
+        FunctionVersionInfo(
+            version=v.version,
+            code_hash=v.code_hash,
+            size=size,
+            compressed=compressed,
+            current=v.id == func.current_version_id,
+            created_at=v.created_at
+        )
+        for v, size, compressed in rows
+    ]
+
+@app.post("/functions/{name}/rollback/{version}")
+async def rollback_function(name: str, version: int, db: Session = Depends(get_db)):
+    """Point the function back at an earlier immutable version"""
+    func = db.query(Function).filter(Function.name == name).first()
+    if not func:
+        raise HTTPException(status_code=404, detail="Function not found")
+    target = db.query(FunctionVersion).filter(
+        FunctionVersion.function_id == func.id, FunctionVersion.version == version).first()
+    if not target:
+        raise HTTPException(status_code=404, detail="Version not found")
+    func.current_version_id = target.id
+    db.commit()
+    return {"message": "Function rolled back", "version": version}
 
 @app.delete("/functions/{name}")
 async def delete_function(name: str, db: Session = Depends(get_db)):
@@ -86,7 +232,8 @@ async def delete_function(name: str, db: Session = Depends(get_db)):
 async def execute_function(
     name: str, 
     params: FunctionExecuteParams = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    metrics_db: Session = Depends(get_metrics_db)
 ):
     # Set default params if not provided
     if params is None:
@@ -108,8 +255,9 @@ async def execute_function(
             from virtualization.runner import run_in_docker
             result = run_in_docker(func.code, func.language, func.timeout, params.warm_start)
         
-        # Save metrics to database
-        save_execution_metrics(db, name, result)
+        # Save metrics to database, tagged with the code version that ran
+        tag_code_version(result, func)
+        save_execution_metrics(metrics_db, name, result)
         
         # Return execution result to the client
         return {
@@ -127,21 +275,23 @@ async def execute_function(
 async def get_function_metrics(
     name: str,
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    metrics_db: Session = Depends(get_metrics_db)
 ):
     # Check if function exists
     func = db.query(Function).filter(Function.name == name).first()
     if not func:
         raise HTTPException(status_code=404, detail="Function not found")
     
-    metrics = get_metrics_for_function(db, name, limit)
+    metrics = get_metrics_for_function(metrics_db, name, limit)
     return metrics
 
 @app.get("/metrics/aggregated")
 async def get_system_metrics(
     function_name: Optional[str] = None,
-    time_range: str = Query("24h", regex="^(1h|24h|7d|30d)$"),
-    db: Session = Depends(get_db)
+    time_range: str = Query("24h", regex=DURATION_PATTERN),
+    db: Session = Depends(get_db),
+    metrics_db: Session = Depends(get_metrics_db)
 ):
     # If function name is provided, check if it exists
     if function_name:
@@ -149,14 +299,61 @@ async def get_system_metrics(
         if not func:
             raise HTTPException(status_code=404, detail="Function not found")
     
-    aggregated = get_aggregated_metrics(db, function_name, time_range)
+    aggregated = get_aggregated_metrics(metrics_db, function_name, time_range)
     return aggregated
 
+@app.get("/metrics/series")
+async def get_metrics_series(
+    function_name: Optional[str] = None,
+    window: str = Query("24h", regex=DURATION_PATTERN),
+    resolution: Optional[str] = Query(None, regex=DURATION_PATTERN),
+    db: Session = Depends(get_db),
+    metrics_db: Session = Depends(get_metrics_db)
+):
+    """Time-bucketed counts, error rate, latency percentiles and cold-start ratio per runtime"""
+    if function_name:
+        func = db.query(Function).filter(Function.name == function_name).first()
+        if not func:
+            raise HTTPException(status_code=404, detail="Function not found")
+
+    try:
+        return get_metric_series(metrics_db, function_name, window, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/metrics/export")
+async def export_metrics(
+    format: str = Query("csv", regex="^(csv|ndjson|arrow|parquet)$"),
+    function_name: Optional[str] = None,
+    runtime: Optional[str] = Query(None, regex="^(docker|gvisor)$"),
+    status: Optional[str] = Query(None, regex="^(success|error|timeout)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    batch_size: int = Query(5000, ge=100, le=50000)
+):
+    """Stream raw metrics still within retention; memory use is bounded by batch_size"""
+    if format in ("arrow", "parquet"):
+        try:
+            require_pyarrow(format)
+        except RuntimeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    extension = {"ndjson": "jsonl", "arrow": "arrows"}.get(format, format)
+    chunks = stream_metrics_export(
+        format, batch_size=batch_size, start=start, end=end,
+        function_name=function_name, runtime=runtime, status=status)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f"attachment; filename=execution_metrics.{extension}"}
+    )
+
 @app.get("/runtime/compare")
 async def compare_runtimes(
     function_name: str,
     iterations: int = Query(5, ge=1, le=20),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    metrics_db: Session = Depends(get_metrics_db)
 ):
     """Compare performance between Docker and gVisor runtimes for a function"""
     # Check if function exists
@@ -176,14 +373,16 @@ async def compare_runtimes(
         logger.info(f"Running Docker iteration {i+1}/{iterations}")
         result = run_in_docker(func.code, func.language, func.timeout, warm=(i > 0))
         docker_results.append(result)
-        save_execution_metrics(db, function_name, result)
+        tag_code_version(result, func)
+        save_execution_metrics(metrics_db, function_name, result)
     
     # Run the function multiple times with gVisor
     for i in range(iterations):
         logger.info(f"Running gVisor iteration {i+1}/{iterations}")
         result = run_in_gvisor(func.code, func.language, func.timeout)
         gvisor_results.append(result)
-        save_execution_metrics(db, function_name, result)
+        tag_code_version(result, func)
+        save_execution_metrics(metrics_db, function_name, result)
     
     # Extract metrics for analysis
     docker_init_times = [r['metrics']['initialization_time_ms'] for r in docker_results]
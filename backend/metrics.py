@@ -1,102 +1,352 @@
 # backend/metrics.py
-from sqlalchemy import create_engine, Column, String, Integer, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import (create_engine, Column, String, Integer, Float, Boolean, DateTime, Text,
+                        MetaData, Table, Index, inspect, select, union_all, text)
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy.sql import func
-from datetime import datetime
+from sqlalchemy.orm import sessionmaker
+from datetime import datetime, date, timedelta
+import os
 import json
+import math
+import time
+import logging
+import threading
 import statistics
 from typing import Dict, List, Any, Optional
 
-from .database import Base, engine, SessionLocal
+from .database import engine as registry_engine, add_missing_columns
+
+logger = logging.getLogger(__name__)
+
+# Metrics live in their own SQLite file so metric writes never contend with
+# function registry reads, and expiring old data never touches functions.db
+METRICS_DB_PATH = os.getenv("METRICS_DB_PATH", "metrics.db")
+METRICS_DATABASE_URL = f"sqlite:///{METRICS_DB_PATH}"
+metrics_engine = create_engine(METRICS_DATABASE_URL)
+MetricsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=metrics_engine)
+MetricsBase = declarative_base()
+
+# Retention configuration
+raw_retention_days = int(os.getenv("METRICS_RAW_RETENTION_DAYS", "7"))
+rollup_retention_days = int(os.getenv("METRICS_ROLLUP_RETENTION_DAYS", "90"))
+rollup_resolution_seconds = 3600  # Raw rows are compacted into hourly buckets
+maintenance_interval_seconds = 300
+
+PARTITION_PREFIX = "execution_metrics_"
+WATERMARK_KEY = "compaction_watermark"
+
+# Latency histograms use geometric buckets, so percentiles from rollups are within ~10%
+HISTOGRAM_GROWTH = 1.1
+
+EPOCH = datetime(1970, 1, 1)
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+DURATION_PATTERN = "^[1-9][0-9]*[smhd]$"
+
+# Series resolutions picked automatically, finest first, and the most points we'll return
+SERIES_RESOLUTIONS = ["1m", "5m", "15m", "1h", "6h", "1d"]
+SERIES_TARGET_POINTS = 300
+SERIES_MAX_POINTS = 1000
+
+RAW_COLUMNS = ["timestamp", "runtime", "status", "cold_start",
+               "initialization_time_ms", "execution_time_ms", "total_time_ms"]
+
+# Known partitions per database URL, so the write path doesn't hit sqlite_master
+_known_partitions: Dict[str, set] = {}
+_partition_tables: Dict[str, Table] = {}
+_partition_metadata = MetaData()
+_partition_lock = threading.Lock()
+
+class MetricRollup(MetricsBase):
+    __tablename__ = "metric_rollups"
 
-# Metrics model definition
-class ExecutionMetric(Base):
-    __tablename__ = "execution_metrics"
-    
     id = Column(Integer, primary_key=True, index=True)
+    bucket_start = Column(DateTime, index=True)
     function_name = Column(String, index=True)
-    runtime = Column(String, index=True)  # docker or gvisor
-    language = Column(String, index=True)
-    cold_start = Column(Boolean, default=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    initialization_time_ms = Column(Integer)
-    execution_time_ms = Column(Integer)
-    total_time_ms = Column(Integer)
-    status = Column(String)  # success, error, timeout
-    error_message = Column(String, nullable=True)
-    memory_usage_mb = Column(Float, nullable=True)  # Nullable for now as we don't collect this yet
-    cpu_usage_percent = Column(Float, nullable=True)  # Nullable for now as we don't collect this yet
+    runtime = Column(String)
+    language = Column(String)
+    count = Column(Integer, default=0)
+    success_count = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    timeout_count = Column(Integer, default=0)
+    cold_start_count = Column(Integer, default=0)
+    sum_initialization_time_ms = Column(Integer, default=0)
+    sum_execution_time_ms = Column(Integer, default=0)
+    sum_total_time_ms = Column(Integer, default=0)
+    max_total_time_ms = Column(Integer, default=0)
+    execution_histogram = Column(Text)  # JSON {bucket: count}
+    total_histogram = Column(Text)  # JSON {bucket: count}
+
+class MetricsMeta(MetricsBase):
+    __tablename__ = "metrics_meta"
+
+    key = Column(String, primary_key=True)
+    value = Column(String)
+
+def get_partition_table(day: date) -> Table:
+    """Return the Table object for the raw metrics partition of a given day"""
+    name = f"{PARTITION_PREFIX}{day:%Y%m%d}"
+    with _partition_lock:
+        table = _partition_tables.get(name)
+        if table is None:
+            table = Table(
+                name, _partition_metadata,
+                Column("id", Integer, primary_key=True),
+                Column("function_name", String),
+                Column("runtime", String),  # docker or gvisor
+                Column("language", String),
+                Column("cold_start", Boolean, default=True),
+                Column("timestamp", DateTime, default=datetime.utcnow),
+                Column("initialization_time_ms", Integer),
+                Column("execution_time_ms", Integer),
+                Column("total_time_ms", Integer),
+                Column("status", String),  # success, error, timeout
+                Column("error_message", String, nullable=True),
+                Column("memory_usage_mb", Float, nullable=True),
+                Column("cpu_usage_percent", Float, nullable=True),
+                Column("code_version", Integer, nullable=True),
+                Column("code_hash", String, nullable=True),
+                Index(f"ix_{name}_function_timestamp", "function_name", "timestamp"),
+            )
+            _partition_tables[name] = table
+        return table
+
+def _partition_day(name: str) -> date:
+    return datetime.strptime(name[len(PARTITION_PREFIX):], "%Y%m%d").date()
+
+def list_partitions(db) -> List[date]:
+    """List the days that have a raw metrics partition, oldest first"""
+    bind = db.get_bind()
+    names = [n for n in inspect(bind).get_table_names() if n.startswith(PARTITION_PREFIX)]
+    return sorted(_partition_day(n) for n in names)
+
+def ensure_partition(db, day: date) -> Table:
+    """Return the partition for a day, creating it on first use"""
+    table = get_partition_table(day)
+    url = str(db.get_bind().url)
+    with _partition_lock:
+        known = table.name in _known_partitions.get(url, set())
+    if not known:
+        connection = db.connection()
+        table.create(bind=connection, checkfirst=True)
+        add_missing_columns(connection, table)
+        with _partition_lock:
+            _known_partitions.setdefault(url, set()).add(table.name)
+    return table
+
+def partitions_between(db, start: Optional[datetime], end: Optional[datetime] = None) -> List[Table]:
+    """Return existing partitions overlapping [start, end), oldest first"""
+    tables = []
+    for day in list_partitions(db):
+        if start and day < start.date():
+            continue
+        if end and day > end.date():
+            continue
+        tables.append(get_partition_table(day))
+    return tables
+
+def select_raw_metrics(db, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       function_name: Optional[str] = None, columns: Optional[List[str]] = None):
+    """Build a UNION ALL select over the raw partitions covering a time window"""
+    selects = []
+    for table in partitions_between(db, start, end):
+        cols = [table.c[c] for c in columns] if columns else [table]
+        query = select(*cols)
+        if start:
+            query = query.where(table.c.timestamp >= start)
+        if end:
+            query = query.where(table.c.timestamp < end)
+        if function_name:
+            query = query.where(table.c.function_name == function_name)
+        selects.append(query)
+
+    if not selects:
+        return None
+    return selects[0] if len(selects) == 1 else union_all(*selects)
+
+def latency_bucket(value_ms: Optional[int]) -> int:
+    """Map a latency to its geometric histogram bucket"""
+    if not value_ms or value_ms <= 1:
+        return 0
+    return int(math.ceil(math.log(value_ms) / math.log(HISTOGRAM_GROWTH)))
+
+def histogram_add(histogram: Dict[int, int], value_ms: Optional[int], count: int = 1) -> None:
+    bucket = latency_bucket(value_ms)
+    histogram[bucket] = histogram.get(bucket, 0) + count
+
+def histogram_merge(histogram: Dict[int, int], encoded: Optional[str]) -> None:
+    """Merge a JSON-encoded histogram into an in-memory one"""
+    if not encoded:
+        return
+    for bucket, count in json.loads(encoded).items():
+        histogram[int(bucket)] = histogram.get(int(bucket), 0) + count
+
+def histogram_percentile(histogram: Dict[int, int], quantile: float) -> Optional[float]:
+    """Estimate a percentile from a histogram, returning the bucket's upper bound"""
+    total = sum(histogram.values())
+    if total == 0:
+        return None
+    rank = quantile * total
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return round(HISTOGRAM_GROWTH ** bucket, 2)
+    return round(HISTOGRAM_GROWTH ** max(histogram), 2)
+
+def parse_duration(value: str) -> timedelta:
+    """Parse durations such as 90s, 5m, 24h or 7d"""
+    value = value.strip()
+    if len(value) < 2 or value[-1] not in DURATION_UNITS or not value[:-1].isdigit() or int(value[:-1]) <= 0:
+        raise ValueError(f"Invalid duration: {value}")
+    return timedelta(seconds=int(value[:-1]) * DURATION_UNITS[value[-1]])
+
+def get_compaction_watermark(db) -> Optional[datetime]:
+    """Raw rows before the watermark have been compacted into rollups"""
+    row = db.get(MetricsMeta, WATERMARK_KEY)
+    return datetime.fromisoformat(row.value) if row else None
+
+def _set_compaction_watermark(db, watermark: datetime) -> None:
+    row = db.get(MetricsMeta, WATERMARK_KEY)
+    if row is None:
+        db.add(MetricsMeta(key=WATERMARK_KEY, value=watermark.isoformat()))
+    else:
+        row.value = watermark.isoformat()
+
+def _floor_time(moment: datetime, resolution_seconds: int) -> datetime:
+    """Round a naive UTC datetime down to a multiple of the resolution"""
+    epoch = int((moment - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=epoch - epoch % resolution_seconds)
 
 def save_execution_metrics(db, function_name: str, result: Dict[str, Any]) -> None:
-    """Save execution metrics to the database"""
+    """Save execution metrics to today's raw partition"""
     if 'metrics' not in result:
         return
-    
+
     metrics = result['metrics']
-    
-    # Create new metric record
-    execution_metric = ExecutionMetric(
+    timestamp = datetime.utcnow()
+    table = ensure_partition(db, timestamp.date())
+
+    db.execute(table.insert().values(
         function_name=function_name,
         runtime=metrics.get('runtime', 'docker'),
         language=metrics.get('language', 'unknown'),
         cold_start=metrics.get('cold_start', True),
+        timestamp=timestamp,
         initialization_time_ms=metrics.get('initialization_time_ms', 0),
         execution_time_ms=metrics.get('execution_time_ms', 0),
         total_time_ms=metrics.get('total_time_ms', 0),
         status=result.get('status', 'unknown'),
         error_message=metrics.get('error', None),
-    )
-    
-    # Add and commit to database
-    db.add(execution_metric)
+        code_version=metrics.get('code_version'),
+        code_hash=metrics.get('code_hash'),
+    ))
     db.commit()
 
+def _format_metric_row(day: date, m) -> Dict[str, Any]:
+    return {
+        "id": f"{day:%Y%m%d}-{m.id}",
+        "function_name": m.function_name,
+        "runtime": m.runtime,
+        "language": m.language,
+        "cold_start": m.cold_start,
+        "timestamp": m.timestamp.isoformat(),
+        "initialization_time_ms": m.initialization_time_ms,
+        "execution_time_ms": m.execution_time_ms,
+        "total_time_ms": m.total_time_ms,
+        "status": m.status,
+        "error_message": m.error_message,
+        "code_version": m.code_version,
+        "code_hash": m.code_hash
+    }
+
 def get_metrics_for_function(db, function_name: str, limit: int = 100) -> List[Dict[str, Any]]:
-    """Get recent metrics for a specific function"""
-    metrics = db.query(ExecutionMetric).filter(
-        ExecutionMetric.function_name == function_name
-    ).order_by(ExecutionMetric.timestamp.desc()).limit(limit).all()
-    
-    return [
-        {
-            "id": m.id,
-            "function_name": m.function_name,
-            "runtime": m.runtime,
-            "language": m.language,
-            "cold_start": m.cold_start,
-            "timestamp": m.timestamp.isoformat(),
-            "initialization_time_ms": m.initialization_time_ms,
-            "execution_time_ms": m.execution_time_ms, 
-            "total_time_ms": m.total_time_ms,
-            "status": m.status,
-            "error_message": m.error_message
-        }
-        for m in metrics
-    ]
+    """Get recent metrics for a specific function, newest partitions first"""
+    results = []
+    for day in reversed(list_partitions(db)):
+        table = get_partition_table(day)
+        rows = db.execute(
+            select(table)
+            .where(table.c.function_name == function_name)
+            .order_by(table.c.timestamp.desc())
+            .limit(limit - len(results))
+        ).all()
+        results.extend(_format_metric_row(day, m) for m in rows)
+        if len(results) >= limit:
+            break
+    return results
+
+def _new_accumulator() -> Dict[str, Any]:
+    return {
+        "count": 0, "success_count": 0, "error_count": 0, "timeout_count": 0, "cold_start_count": 0,
+        "sum_initialization_time_ms": 0, "sum_execution_time_ms": 0, "sum_total_time_ms": 0,
+        "max_total_time_ms": 0, "execution_histogram": {}, "total_histogram": {},
+        "runtime_breakdown": {"docker": 0, "gvisor": 0},
+    }
+
+def _accumulate_row(acc: Dict[str, Any], m) -> None:
+    acc["count"] += 1
+    if m.status == "success":
+        acc["success_count"] += 1
+    elif m.status == "error":
+        acc["error_count"] += 1
+    elif m.status == "timeout":
+        acc["timeout_count"] += 1
+    if m.cold_start:
+        acc["cold_start_count"] += 1
+    acc["sum_initialization_time_ms"] += m.initialization_time_ms or 0
+    acc["sum_execution_time_ms"] += m.execution_time_ms or 0
+    acc["sum_total_time_ms"] += m.total_time_ms or 0
+    acc["max_total_time_ms"] = max(acc["max_total_time_ms"], m.total_time_ms or 0)
+    histogram_add(acc["execution_histogram"], m.execution_time_ms)
+    histogram_add(acc["total_histogram"], m.total_time_ms)
+    acc["runtime_breakdown"][m.runtime] = acc["runtime_breakdown"].get(m.runtime, 0) + 1
+
+def _accumulate_rollup(acc: Dict[str, Any], r: MetricRollup) -> None:
+    for field in ("count", "success_count", "error_count", "timeout_count", "cold_start_count",
+                  "sum_initialization_time_ms", "sum_execution_time_ms", "sum_total_time_ms"):
+        acc[field] += getattr(r, field) or 0
+    acc["max_total_time_ms"] = max(acc["max_total_time_ms"], r.max_total_time_ms or 0)
+    histogram_merge(acc["execution_histogram"], r.execution_histogram)
+    histogram_merge(acc["total_histogram"], r.total_histogram)
+    acc["runtime_breakdown"][r.runtime] = acc["runtime_breakdown"].get(r.runtime, 0) + r.count
 
-def get_aggregated_metrics(db, function_name: Optional[str] = None, 
+def _window_rollups(db, start: datetime, watermark: Optional[datetime], function_name: Optional[str] = None):
+    """Rollups for the compacted part of a window"""
+    if not watermark or watermark <= start:
+        return []
+    rollups = db.query(MetricRollup).filter(
+        MetricRollup.bucket_start >= start, MetricRollup.bucket_start < watermark)
+    if function_name:
+        rollups = rollups.filter(MetricRollup.function_name == function_name)
+    return rollups
+
+def _window_raw_rows(db, start: datetime, watermark: Optional[datetime], function_name: Optional[str] = None):
+    """Raw rows for the part of a window after the compaction watermark"""
+    raw_start = max(start, watermark) if watermark else start
+    query = select_raw_metrics(db, raw_start, function_name=function_name, columns=RAW_COLUMNS)
+    if query is None:
+        return []
+    return db.execute(query, execution_options={"yield_per": 1000})
+
+def get_aggregated_metrics(db, function_name: Optional[str] = None,
                           time_range: str = "24h") -> Dict[str, Any]:
     """Get aggregated metrics for the system or a specific function"""
-    query = db.query(ExecutionMetric)
-    
-    # Filter by function name if provided
-    if function_name:
-        query = query.filter(ExecutionMetric.function_name == function_name)
-    
-    # Filter by time range
-    if time_range == "1h":
-        query = query.filter(ExecutionMetric.timestamp >= func.datetime('now', '-1 hour'))
-    elif time_range == "24h":
-        query = query.filter(ExecutionMetric.timestamp >= func.datetime('now', '-1 day'))
-    elif time_range == "7d":
-        query = query.filter(ExecutionMetric.timestamp >= func.datetime('now', '-7 days'))
-    elif time_range == "30d":
-        query = query.filter(ExecutionMetric.timestamp >= func.datetime('now', '-30 days'))
-    
-    metrics = query.all()
-    
-    if not metrics:
+    start = datetime.utcnow() - parse_duration(time_range)
+    watermark = get_compaction_watermark(db)
+
+    acc = _new_accumulator()
+    execution_times = []
+
+    for r in _window_rollups(db, start, watermark, function_name):
+        _accumulate_rollup(acc, r)
+
+    for m in _window_raw_rows(db, start, watermark, function_name):
+        _accumulate_row(acc, m)
+        if m.execution_time_ms is not None:
+            execution_times.append(m.execution_time_ms)
+
+    total_count = acc["count"]
+    if not total_count:
         return {
             "count": 0,
             "avg_execution_time_ms": 0,
@@ -106,48 +356,225 @@ def get_aggregated_metrics(db, function_name: Optional[str] = None,
             "timeout_rate": 0,
             "cold_start_percentage": 0
         }
-    
-    # Calculate aggregates
-    total_count = len(metrics)
-    success_count = sum(1 for m in metrics if m.status == "success")
-    error_count = sum(1 for m in metrics if m.status == "error")
-    timeout_count = sum(1 for m in metrics if m.status == "timeout")
-    cold_start_count = sum(1 for m in metrics if m.cold_start)
-    
-    execution_times = [m.execution_time_ms for m in metrics if m.execution_time_ms is not None]
-    total_times = [m.total_time_ms for m in metrics if m.total_time_ms is not None]
-    
-    # Compute statistics
-    avg_execution_time = statistics.mean(execution_times) if execution_times else 0
-    avg_total_time = statistics.mean(total_times) if total_times else 0
-    
-    # Additional statistics if we have enough data
-    if len(execution_times) >= 2:
-        p95_execution_time = sorted(execution_times)[int(len(execution_times) * 0.95)]
-        p99_execution_time = sorted(execution_times)[int(len(execution_times) * 0.99)]
+
+    avg_execution_time = acc["sum_execution_time_ms"] / total_count
+    avg_total_time = acc["sum_total_time_ms"] / total_count
+
+    # Exact percentiles while everything is raw, histogram estimates once rollups are involved
+    if len(execution_times) == total_count and total_count >= 2:
+        ordered = sorted(execution_times)
+        p95_execution_time = ordered[int(total_count * 0.95)]
+        p99_execution_time = ordered[int(total_count * 0.99)]
         stdev_execution_time = statistics.stdev(execution_times)
+    elif total_count >= 2:
+        p95_execution_time = histogram_percentile(acc["execution_histogram"], 0.95)
+        p99_execution_time = histogram_percentile(acc["execution_histogram"], 0.99)
+        stdev_execution_time = None
     else:
-        p95_execution_time = avg_execution_time
-        p99_execution_time = avg_execution_time
-        stdev_execution_time = 0
-    
+        p95_execution_time = p99_execution_time = stdev_execution_time = None
+
     return {
         "count": total_count,
         "avg_execution_time_ms": avg_execution_time,
-        "p95_execution_time_ms": p95_execution_time if len(execution_times) >= 2 else None,
-        "p99_execution_time_ms": p99_execution_time if len(execution_times) >= 2 else None,
-        "stdev_execution_time_ms": stdev_execution_time if len(execution_times) >= 2 else None,
+        "p95_execution_time_ms": p95_execution_time,
+        "p99_execution_time_ms": p99_execution_time,
+        "stdev_execution_time_ms": stdev_execution_time,
         "avg_total_time_ms": avg_total_time,
-        "success_rate": success_count / total_count if total_count > 0 else 0,
-        "error_rate": error_count / total_count if total_count > 0 else 0,
-        "timeout_rate": timeout_count / total_count if total_count > 0 else 0,
-        "cold_start_percentage": cold_start_count / total_count if total_count > 0 else 0,
-        "runtime_breakdown": {
-            "docker": sum(1 for m in metrics if m.runtime == "docker"),
-            "gvisor": sum(1 for m in metrics if m.runtime == "gvisor")
-        }
+        "success_rate": acc["success_count"] / total_count,
+        "error_rate": acc["error_count"] / total_count,
+        "timeout_rate": acc["timeout_count"] / total_count,
+        "cold_start_percentage": acc["cold_start_count"] / total_count,
+        "runtime_breakdown": acc["runtime_breakdown"]
+    }
+
+def pick_series_resolution(window: timedelta) -> str:
+    """Choose the finest standard resolution that keeps the series near the target size"""
+    for resolution in SERIES_RESOLUTIONS:
+        if window / parse_duration(resolution) <= SERIES_TARGET_POINTS:
+            return resolution
+    return SERIES_RESOLUTIONS[-1]
+
+def _series_point(bucket_start: datetime, runtime: str, acc: Dict[str, Any]) -> Dict[str, Any]:
+    count = acc["count"]
+    return {
+        "bucket_start": bucket_start.isoformat(),
+        "runtime": runtime,
+        "count": count,
+        "error_rate": (acc["error_count"] + acc["timeout_count"]) / count,
+        "cold_start_ratio": acc["cold_start_count"] / count,
+        "avg_total_time_ms": acc["sum_total_time_ms"] / count,
+        "p50_total_time_ms": histogram_percentile(acc["total_histogram"], 0.50),
+        "p95_total_time_ms": histogram_percentile(acc["total_histogram"], 0.95),
+    }
+
+def get_metric_series(db, function_name: Optional[str] = None, window: str = "24h",
+                      resolution: Optional[str] = None) -> Dict[str, Any]:
+    """Get a time-bucketed series split by runtime, for charting"""
+    window_delta = parse_duration(window)
+    resolution = resolution or pick_series_resolution(window_delta)
+    resolution_seconds = int(parse_duration(resolution).total_seconds())
+    if window_delta.total_seconds() / resolution_seconds > SERIES_MAX_POINTS:
+        raise ValueError(f"Window {window} at {resolution} resolution exceeds {SERIES_MAX_POINTS} buckets")
+
+    start = _floor_time(datetime.utcnow() - window_delta, resolution_seconds)
+    watermark = get_compaction_watermark(db)
+    buckets: Dict[tuple, Dict[str, Any]] = {}
+
+    # Rollups are hourly, so at finer resolutions compacted hours land in their first bucket
+    for r in _window_rollups(db, start, watermark, function_name):
+        key = (_floor_time(r.bucket_start, resolution_seconds), r.runtime)
+        _accumulate_rollup(buckets.setdefault(key, _new_accumulator()), r)
+
+    for m in _window_raw_rows(db, start, watermark, function_name):
+        key = (_floor_time(m.timestamp, resolution_seconds), m.runtime)
+        _accumulate_row(buckets.setdefault(key, _new_accumulator()), m)
+
+    return {
+        "function_name": function_name,
+        "window": window,
+        "resolution": resolution,
+        "start": start.isoformat(),
+        "series": [_series_point(bucket_start, runtime, buckets[(bucket_start, runtime)])
+                   for bucket_start, runtime in sorted(buckets)],
     }
 
+def compact_metrics(db, until: Optional[datetime] = None) -> int:
+    """Roll raw rows up to `until` into hourly buckets, one partition at a time"""
+    until = _floor_time(until or datetime.utcnow(), rollup_resolution_seconds)
+    watermark = get_compaction_watermark(db)
+    partitions = list_partitions(db)
+    if watermark is None:
+        if not partitions:
+            return 0
+        watermark = datetime.combine(partitions[0], datetime.min.time())
+
+    created = 0
+    for day in partitions:
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        start, end = max(watermark, day_start), min(until, day_end)
+        if start >= end:
+            continue
+
+        buckets: Dict[tuple, Dict[str, Any]] = {}
+        query = select_raw_metrics(db, start, end)
+        for m in db.execute(query):
+            key = (_floor_time(m.timestamp, rollup_resolution_seconds), m.function_name, m.runtime, m.language)
+            if key not in buckets:
+                buckets[key] = _new_accumulator()
+            _accumulate_row(buckets[key], m)
+
+        for (bucket_start, function_name, runtime, language), acc in buckets.items():
+            db.add(MetricRollup(
+                bucket_start=bucket_start,
+                function_name=function_name,
+                runtime=runtime,
+                language=language,
+                count=acc["count"],
+                success_count=acc["success_count"],
+                error_count=acc["error_count"],
+                timeout_count=acc["timeout_count"],
+                cold_start_count=acc["cold_start_count"],
+                sum_initialization_time_ms=acc["sum_initialization_time_ms"],
+                sum_execution_time_ms=acc["sum_execution_time_ms"],
+                sum_total_time_ms=acc["sum_total_time_ms"],
+                max_total_time_ms=acc["max_total_time_ms"],
+                execution_histogram=json.dumps(acc["execution_histogram"]),
+                total_histogram=json.dumps(acc["total_histogram"]),
+            ))
+        created += len(buckets)
+
+        # Advance the watermark in the same transaction as the rollups it covers
+        watermark = end
+        _set_compaction_watermark(db, watermark)
+        db.commit()
+
+    return created
+
+def expire_metrics(db, now: Optional[datetime] = None) -> List[date]:
+    """Drop raw partitions past retention and delete expired rollups"""
+    now = now or datetime.utcnow()
+    raw_cutoff = (now - timedelta(days=raw_retention_days)).date()
+    watermark = get_compaction_watermark(db)
+    bind = db.connection()
+
+    dropped = []
+    for day in list_partitions(db):
+        day_end = datetime.combine(day, datetime.min.time()) + timedelta(days=1)
+        # Never drop a day whose rows haven't been rolled up yet
+        if day >= raw_cutoff or watermark is None or day_end > watermark:
+            continue
+        get_partition_table(day).drop(bind=bind)
+        dropped.append(day)
+        logger.info(f"Dropped expired metrics partition {day}")
+
+    db.query(MetricRollup).filter(
+        MetricRollup.bucket_start < now - timedelta(days=rollup_retention_days)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+    if dropped:
+        with _partition_lock:
+            _known_partitions.get(str(db.get_bind().url), set()).difference_update(
+                get_partition_table(day).name for day in dropped)
+    return dropped
+
+def run_metrics_maintenance() -> None:
+    """Compact closed hours and expire old data"""
+    db = MetricsSessionLocal()
+    try:
+        compact_metrics(db)
+        expire_metrics(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Metrics maintenance failed: {str(e)}")
+    finally:
+        db.close()
+
+def start_maintenance_thread():
+    def maintenance_task():
+        while True:
+            run_metrics_maintenance()
+            time.sleep(maintenance_interval_seconds)
+
+    maintenance_thread = threading.Thread(target=maintenance_task, daemon=True)
+    maintenance_thread.start()
+
+def import_legacy_metrics() -> int:
+    """Move rows from the old execution_metrics table in functions.db into the metrics store"""
+    if "execution_metrics" not in inspect(registry_engine).get_table_names():
+        return 0
+
+    db = MetricsSessionLocal()
+    try:
+        with registry_engine.begin() as registry:
+            rows = registry.execute(text(
+                "SELECT function_name, runtime, language, cold_start, timestamp, initialization_time_ms, "
+                "execution_time_ms, total_time_ms, status, error_message FROM execution_metrics"
+            )).mappings().all()
+            for row in rows:
+                values = dict(row)
+                timestamp = values["timestamp"]
+                if isinstance(timestamp, str):
+                    values["timestamp"] = timestamp = datetime.fromisoformat(timestamp)
+                db.execute(ensure_partition(db, timestamp.date()).insert().values(**values))
+            db.commit()
+            registry.execute(text("DROP TABLE execution_metrics"))
+        logger.info(f"Imported {len(rows)} legacy metric rows into {METRICS_DB_PATH}")
+        return len(rows)
+    finally:
+        db.close()
+
 # Create tables if they don't exist
-def create_metrics_tables():
-    Base.metadata.create_all(bind=engine)
+def upgrade_partitions(bind) -> None:
+    """Bring partitions created by older versions up to the current column set"""
+    with bind.begin() as connection:
+        for name in inspect(connection).get_table_names():
+            if name.startswith(PARTITION_PREFIX):
+                add_missing_columns(connection, get_partition_table(_partition_day(name)))
+
+def create_metrics_tables(bind=None):
+    MetricsBase.metadata.create_all(bind=bind or metrics_engine)
+    upgrade_partitions(bind or metrics_engine)
+    if bind is None:
+        import_legacy_metrics()
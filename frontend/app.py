@@ -42,6 +42,18 @@ def get_functions():
         st.error(f"API Error: {str(e)}")
         return []
 
+def get_function(name):
+    try:
+        response = requests.get(f"{API_BASE_URL}/functions/{name}")
+        if response.status_code == 200:
+            return response.json()
+        else:
+            st.error(f"Error fetching function: {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"API Error: {str(e)}")
+        return None
+
 def create_function(name, language, code, timeout):
     try:
         data = {
@@ -134,6 +146,38 @@ def get_function_metrics(name):
         st.error(f"API Error: {str(e)}")
         return None
 
+def get_aggregated_metrics(name=None, time_range="24h"):
+    try:
+        params = {"time_range": time_range}
+        if name:
+            params["function_name"] = name
+        response = requests.get(f"{API_BASE_URL}/metrics/aggregated", params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            st.error(f"Error fetching metrics: {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"API Error: {str(e)}")
+        return None
+
+def get_metric_series(name=None, window="24h", resolution=None):
+    try:
+        params = {"window": window}
+        if name:
+            params["function_name"] = name
+        if resolution:
+            params["resolution"] = resolution
+        response = requests.get(f"{API_BASE_URL}/metrics/series", params=params)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            st.error(f"Error fetching metric series: {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"API Error: {str(e)}")
+        return None
+
 def compare_runtimes(name, iterations=3):
     try:
         with st.spinner(f"Comparing runtimes for '{name}' ({iterations} iterations)..."):
@@ -201,8 +245,8 @@ def show_functions_page():
     
     # Handle function editing/execution
     else:
-        # Find the selected function
-        func = next((f for f in st.session_state.functions if f["name"] == selected_function_name), None)
+        # The listing omits code, so fetch the full definition of the selected function
+        func = get_function(selected_function_name)
         if func:
             st.subheader(f"Function: {func['name']}")
             
@@ -277,56 +321,6 @@ def show_functions_page():
                         st.subheader("Standard Error")
                         st.code(result["result"]["stderr"])
                     
-def calculate_function_stats(executions: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Calculate statistics for a list of function executions"""
-    if not executions:
-        return {
-            "total_executions": 0,
-            "success_rate": 0,
-            "avg_initialization_time": 0,
-            "min_initialization_time": 0,
-            "max_initialization_time": 0,
-            "avg_execution_time": 0,
-            "min_execution_time": 0,
-            "max_execution_time": 0,
-            "avg_total_time": 0,
-            "min_total_time": 0,
-            "max_total_time": 0,
-            "runtime_distribution": {"docker": 0, "gvisor": 0},
-            "warm_vs_cold": {"warm": 0, "cold": 0}
-        }
-    
-    # Calculate success rate
-    successful = sum(1 for e in executions if e.get("success", False))
-    success_rate = (successful / len(executions)) * 100 if executions else 0
-    
-    # Calculate time averages
-    exec_times = [e["execution_time_ms"] for e in executions if "execution_time_ms" in e]
-    init_times = [e["initialization_time_ms"] for e in executions if "initialization_time_ms" in e]
-    total_times = [e["total_time_ms"] for e in executions if "total_time_ms" in e]
-    
-    return {
-        "total_executions": len(executions),
-        "success_rate": success_rate,
-        "avg_initialization_time": sum(init_times)/len(init_times) if init_times else 0,
-        "min_initialization_time": min(init_times) if init_times else 0,
-        "max_initialization_time": max(init_times) if init_times else 0,
-        "avg_execution_time": sum(exec_times)/len(exec_times) if exec_times else 0,
-        "min_execution_time": min(exec_times) if exec_times else 0,
-        "max_execution_time": max(exec_times) if exec_times else 0,
-        "avg_total_time": sum(total_times)/len(total_times) if total_times else 0,
-        "min_total_time": min(total_times) if total_times else 0,
-        "max_total_time": max(total_times) if total_times else 0,
-        "runtime_distribution": {
-            "docker": sum(1 for e in executions if e.get("runtime") == "docker"),
-            "gvisor": sum(1 for e in executions if e.get("runtime") == "gvisor")
-        },
-        "warm_vs_cold": {
-            "warm": sum(1 for e in executions if not e.get("cold_start", True)),
-            "cold": sum(1 for e in executions if e.get("cold_start", True))
-        }
-    }
-
 # Metrics Visualization Page
 def show_metrics_page():
     st.title("Function Metrics")
@@ -339,35 +333,21 @@ def show_metrics_page():
         st.warning("No functions found. Create a function first.")
         return
     
-    selected_function = st.selectbox("Select Function", function_names)
+    col1, col2 = st.columns(2)
+    with col1:
+        selected_function = st.selectbox("Select Function", function_names)
+    with col2:
+        window = st.selectbox("Time Window", ["1h", "24h", "7d", "30d"], index=1)
     
     if selected_function:
         with st.spinner("Loading metrics..."):
-            metrics_data = get_function_metrics(selected_function)
+            # Both are computed server-side, so the payload stays small however much history exists
+            summary = get_aggregated_metrics(selected_function, window)
+            series = get_metric_series(selected_function, window)
             
-            if not metrics_data:
+            if not summary or not summary["count"]:
                 st.warning(f"No metrics data available for {selected_function}")
                 return
-                
-            # Convert metrics to the expected format
-            executions = []
-            for metric in metrics_data:
-                executions.append({
-                    "id": metric["id"],
-                    "function_name": metric["function_name"],
-                    "runtime": metric["runtime"],
-                    "language": metric["language"],
-                    "initialization_time_ms": metric["initialization_time_ms"],
-                    "execution_time_ms": metric["execution_time_ms"],
-                    "total_time_ms": metric["total_time_ms"],
-                    "cold_start": metric["cold_start"],
-                    "error": metric["error_message"],
-                    "timestamp": metric["timestamp"],
-                    "success": metric["status"] == "success"
-                })
-            
-            # Calculate statistics
-            stats = calculate_function_stats(executions)
             
             # Display metrics
             st.subheader(f"Metrics for {selected_function}")
@@ -376,45 +356,69 @@ def show_metrics_page():
             st.subheader("Summary Statistics")
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total Executions", stats["total_executions"])
-                st.metric("Success Rate", f"{stats['success_rate']:.2f}%")
+                st.metric("Total Executions", summary["count"])
+                st.metric("Success Rate", f"{summary['success_rate'] * 100:.2f}%")
             with col2:
-                st.metric("Avg Init Time (ms)", f"{stats['avg_initialization_time']:.2f}")
-                st.metric("Min Init Time (ms)", stats["min_initialization_time"])
-                st.metric("Max Init Time (ms)", stats["max_initialization_time"])
+                st.metric("Avg Execution Time (ms)", f"{summary['avg_execution_time_ms']:.2f}")
+                st.metric("P95 Execution Time (ms)", summary["p95_execution_time_ms"])
             with col3:
-                st.metric("Avg Execution Time (ms)", f"{stats['avg_execution_time']:.2f}")
-                st.metric("Min Execution Time (ms)", stats["min_execution_time"])
-                st.metric("Max Execution Time (ms)", stats["max_execution_time"])
+                st.metric("Avg Total Time (ms)", f"{summary['avg_total_time_ms']:.2f}")
+                st.metric("Cold Start %", f"{summary['cold_start_percentage'] * 100:.2f}%")
+            
+            if not series or not series["series"]:
+                return
             
             # Prepare data for charts
             import pandas as pd
             import plotly.express as px
             
-            df = pd.DataFrame(executions)
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
+            df = pd.DataFrame(series["series"])
+            df["bucket_start"] = pd.to_datetime(df["bucket_start"])
             
-            # Execution time over time
-            st.subheader("Execution Time Over Time")
+            # Latency percentiles over time
+            st.subheader(f"Latency Over Time ({series['resolution']} buckets)")
+            latency = df.melt(
+                id_vars=["bucket_start", "runtime"],
+                value_vars=["p50_total_time_ms", "p95_total_time_ms"],
+                var_name="percentile",
+                value_name="total_time_ms"
+            )
             fig = px.line(
-                df, 
-                x="timestamp", 
-                y="execution_time_ms",
+                latency,
+                x="bucket_start",
+                y="total_time_ms",
                 color="runtime",
+                line_dash="percentile",
                 markers=True,
-                title="Execution Time Trend"
+                title="P50 / P95 Total Time"
             )
             st.plotly_chart(fig, use_container_width=True)
             
+            col1, col2 = st.columns(2)
+            with col1:
+                st.subheader("Invocations")
+                fig = px.bar(df, x="bucket_start", y="count", color="runtime")
+                st.plotly_chart(fig, use_container_width=True)
+            with col2:
+                st.subheader("Error Rate and Cold Starts")
+                rates = df.melt(
+                    id_vars=["bucket_start", "runtime"],
+                    value_vars=["error_rate", "cold_start_ratio"],
+                    var_name="rate",
+                    value_name="value"
+                )
+                fig = px.line(rates, x="bucket_start", y="value", color="rate", line_dash="runtime", markers=True)
+                st.plotly_chart(fig, use_container_width=True)
+            
             # Runtime distribution pie chart
             st.subheader("Runtime Distribution")
-            runtime_counts = df["runtime"].value_counts().reset_index()
+            runtime_counts = df.groupby("runtime")["count"].sum().reset_index()
             runtime_counts.columns = ["Runtime", "Count"]
             fig = px.pie(runtime_counts, values="Count", names="Runtime")
             st.plotly_chart(fig, use_container_width=True)
             
             # Raw data
-            with st.expander("View Raw Data"):
+            with st.expander("View Series Data"):
                 st.dataframe(df)
             
 def show_comparison_page():
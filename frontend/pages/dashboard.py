@@ -31,7 +31,7 @@ time_range = st.selectbox(
 @st.cache_data(ttl=300)  # Cache for 5 minutes
 def get_system_metrics(days):
     try:
-        response = requests.get(f"{API_BASE_URL}/metrics/aggregated?days={days}")
+        response = requests.get(f"{API_BASE_URL}/metrics/aggregated", params={"time_range": f"{days}d"})
         if response.status_code == 200:
             return response.json()
         else:
@@ -41,8 +41,22 @@ def get_system_metrics(days):
         st.error(f"API Error: {str(e)}")
         return None
 
+@st.cache_data(ttl=300)  # Cache for 5 minutes
+def get_system_series(days):
+    try:
+        response = requests.get(f"{API_BASE_URL}/metrics/series", params={"window": f"{days}d"})
+        if response.status_code == 200:
+            return response.json()
+        else:
+            st.error(f"Error fetching metric series: {response.text}")
+            return None
+    except Exception as e:
+        st.error(f"API Error: {str(e)}")
+        return None
+
 with st.spinner("Loading system metrics..."):
     system_data = get_system_metrics(time_range)
+    series_data = get_system_series(time_range)
     
     # Add debugging information
     st.write("API Response Keys:", list(system_data.keys()) if system_data else "No data")
@@ -99,7 +113,27 @@ if "error_rate" in system_data and "timeout_rate" in system_data:
     )
     st.plotly_chart(fig, use_container_width=True)
 
-# Add execution time distribution if we had that data
-# This is a placeholder - you can add this if you enhance your backend later
+# Latency and cold starts over time, pre-bucketed by the backend
 st.subheader("Performance Analysis")
+if series_data and series_data["series"]:
+    series_df = pd.DataFrame(series_data["series"])
+    series_df["bucket_start"] = pd.to_datetime(series_df["bucket_start"])
+    fig = px.line(
+        series_df,
+        x="bucket_start",
+        y="p95_total_time_ms",
+        color="runtime",
+        markers=True,
+        title=f"P95 Total Time ({series_data['resolution']} buckets)"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    fig = px.line(
+        series_df,
+        x="bucket_start",
+        y="cold_start_ratio",
+        color="runtime",
+        markers=True,
+        title="Cold Start Ratio"
+    )
+    st.plotly_chart(fig, use_container_width=True)
 st.info("For detailed function-specific metrics, visit the Functions page.")
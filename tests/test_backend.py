@@ -109,3 +109,159 @@ def test_delete_function(client):
     # Verify deletion
     get_response = client.get(f"/functions/{function_data['name']}")
     assert get_response.status_code == 404
+
+def test_metrics_compaction_and_expiry(tmp_path):
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend import metrics
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+    metrics.create_metrics_tables(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    # Ten days ago is past the default 7 day raw retention
+    old_day = datetime.utcnow().replace(hour=12, minute=0) - timedelta(days=10)
+    table = metrics.ensure_partition(db, old_day.date())
+    for i, status in enumerate(["success", "success", "error"]):
+        db.execute(table.insert().values(
+            function_name="compacted", runtime="docker", language="python", cold_start=(i == 0),
+            timestamp=old_day + timedelta(minutes=i), initialization_time_ms=10,
+            execution_time_ms=100, total_time_ms=110, status=status))
+    metrics.save_execution_metrics(db, "compacted", {
+        "status": "success",
+        "metrics": {"runtime": "docker", "language": "python", "execution_time_ms": 50, "total_time_ms": 60}
+    })
+
+    assert metrics.compact_metrics(db) >= 1
+    assert metrics.expire_metrics(db) == [old_day.date()]
+    assert old_day.date() not in metrics.list_partitions(db)
+
+    # The expired day is still visible through its rollup
+    aggregated = metrics.get_aggregated_metrics(db, "compacted", "30d")
+    assert aggregated["count"] == 4
+    assert aggregated["error_rate"] == 0.25
+    db.close()
+
+def test_list_functions_projection_and_etag(client):
+    function_data = {
+        "name": "test_list_projection",
+        "language": "python",
+        "code": "print('hello world')",
+        "timeout": 30
+    }
+    client.delete(f"/functions/{function_data['name']}")
+    client.post("/functions/", json=function_data)
+
+    # Code is excluded unless requested
+    response = client.get("/functions/")
+    listed = next(f for f in response.json() if f["name"] == function_data["name"])
+    assert "code" not in listed
+    assert int(response.headers["X-Total-Count"]) >= 1
+
+    projected = client.get("/functions/", params={"fields": "code", "limit": 1000}).json()
+    listed = next(f for f in projected if f["name"] == function_data["name"])
+    assert listed == {"name": function_data["name"], "code": function_data["code"]}
+
+    assert client.get("/functions/", params={"fields": "secret"}).status_code == 400
+    assert len(client.get("/functions/", params={"limit": 1}).json()) == 1
+
+    # Unchanged listings come back as 304 until something changes
+    etag = response.headers["ETag"]
+    assert client.get("/functions/", headers={"If-None-Match": etag}).status_code == 304
+    client.delete(f"/functions/{function_data['name']}")
+    assert client.get("/functions/", headers={"If-None-Match": etag}).status_code == 200
+
+def test_metrics_series(client):
+    import uuid
+    # Metrics outlive the function, so use a fresh name per run
+    function_data = {
+        "name": f"test_metrics_series_{uuid.uuid4().hex[:8]}",
+        "language": "python",
+        "code": "print('hello world')",
+        "timeout": 30
+    }
+    client.post("/functions/", json=function_data)
+
+    from backend.metrics import MetricsSessionLocal, save_execution_metrics
+    db = MetricsSessionLocal()
+    for total, status, cold in [(100, "success", True), (20, "success", False), (30, "error", False)]:
+        save_execution_metrics(db, function_data["name"], {
+            "status": status,
+            "metrics": {"runtime": "docker", "language": "python", "cold_start": cold,
+                        "execution_time_ms": total, "total_time_ms": total}
+        })
+    db.close()
+
+    response = client.get("/metrics/series", params={"function_name": function_data["name"], "window": "1h"})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["resolution"] == "1m"
+    assert sum(p["count"] for p in body["series"]) == 3
+    point = body["series"][-1]
+    assert point["runtime"] == "docker"
+    assert point["p95_total_time_ms"] >= point["p50_total_time_ms"]
+
+    # Too many buckets for the window is rejected rather than silently truncated
+    response = client.get("/metrics/series", params={"window": "30d", "resolution": "1m"})
+    assert response.status_code == 400
+
+    client.delete(f"/functions/{function_data['name']}")
+
+def test_metrics_export(client):
+    import io
+    import json
+    import uuid
+    from backend.metrics import MetricsSessionLocal, save_execution_metrics
+
+    name = f"test_metrics_export_{uuid.uuid4().hex[:8]}"
+    db = MetricsSessionLocal()
+    for status in ["success", "error", "success"]:
+        save_execution_metrics(db, name, {
+            "status": status,
+            "metrics": {"runtime": "docker", "language": "python", "execution_time_ms": 5, "total_time_ms": 9}
+        })
+    db.close()
+
+    response = client.get("/metrics/export", params={"function_name": name, "format": "csv", "batch_size": 100})
+    assert response.status_code == 200
+    lines = response.text.strip().splitlines()
+    assert lines[0].startswith("function_name,")
+    assert len(lines) == 4
+
+    response = client.get("/metrics/export", params={"function_name": name, "format": "ndjson", "status": "error"})
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["status"] for r in rows] == ["error"]
+
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+    response = client.get("/metrics/export", params={"function_name": name, "format": "parquet"})
+    assert pyarrow.parquet.read_table(io.BytesIO(response.content)).num_rows == 3
+    response = client.get("/metrics/export", params={"function_name": name, "format": "arrow"})
+    assert pyarrow.ipc.open_stream(response.content).read_all().num_rows == 3
+
+def test_function_versions_and_rollback(client):
+    name = "test_function_versions"
+    client.delete(f"/functions/{name}")
+    large_code = "print('hello world')\n" * 200
+    client.post("/functions/", json={"name": name, "language": "python", "code": large_code, "timeout": 30})
+
+    # Re-saving identical code doesn't create a new version
+    update = {"name": name, "language": "python", "code": large_code, "timeout": 45}
+    assert client.put(f"/functions/{name}", json=update).json()["version"] == 1
+    update["code"] = "print('v2')"
+    assert client.put(f"/functions/{name}", json=update).json()["version"] == 2
+
+    versions = client.get(f"/functions/{name}/versions").json()
+    assert [v["version"] for v in versions] == [2, 1]
+    assert versions[0]["current"] and not versions[1]["current"]
+    assert versions[1]["compressed"] and versions[1]["size"] == len(large_code)
+
+    assert client.post(f"/functions/{name}/rollback/1").status_code == 200
+    detail = client.get(f"/functions/{name}").json()
+    assert detail["code"] == large_code
+    assert detail["version"] == 1
+    assert detail["code_hash"] == versions[1]["code_hash"]
+    assert client.post(f"/functions/{name}/rollback/9").status_code == 404
+
+    client.delete(f"/functions/{name}")
@@ -36,6 +36,7 @@ def run_in_gvisor(code: str, language: str, timeout: int = 30) -> Dict[str, Any]
         'execution_time_ms': 0,
         'initialization_time_ms': 0,
         'total_time_ms': 0,
+        'cold_start': True,  # Every gVisor run starts a fresh sandbox
         'error': None
     }
     
@@ -147,6 +147,7 @@ def run_in_docker(code: str, language: str, timeout: int = 30, warm: bool = True
         'initialization_time_ms': 0,
         'total_time_ms': 0,
         'warm_start': warm,
+        'cold_start': True,
         'error': None
     }
     
@@ -155,7 +156,9 @@ def run_in_docker(code: str, language: str, timeout: int = 30, warm: bool = True
         if warm:
             # Try to get a container from the pool
             container = get_container_from_pool(language)
-            if not container:
+            if container:
+                metrics['cold_start'] = False
+            else:
                 # Initialize pool if it doesn't exist
                 initialize_container_pool(language)
                 